@@ -0,0 +1,31 @@
+# src/fathom/config.py
+
+from pathlib import Path
+import functools
+from typing import Dict, Any
+import yaml
+
+# Prefer the libyaml-backed C loader; fall back if PyYAML was built without it.
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# --- Configuration Loading ---
+@functools.lru_cache(maxsize=None)
+def load_config(config_path: Path = Path("config.yaml")) -> Dict[str, Any]:
+    """Loads configuration from a YAML file. Each path is only parsed once per process."""
+    try:
+        f = open(config_path, 'r')
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Configuration file not found at {config_path}") from None
+    with f:
+        return yaml.load(f, Loader=_YAML_LOADER)
+
+def get_config() -> Dict[str, Any]:
+    """Returns the process-wide configuration, reading config.yaml on first use."""
+    return load_config()
+
+def __getattr__(name: str) -> Any:
+    # CONFIG is resolved on first access, so importing this module alone
+    # doesn't touch the filesystem.
+    if name == "CONFIG":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,10 +3,12 @@
 from pathlib import Path
 import zipfile
 import os
-from typing import List
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Tuple
 
 # Import Librarian for project management
-from .librarian_new import add_project, list_projects, create_tables
+from .librarian import bulk_add_projects, list_projects, create_tables
 
 def find_source_jars(cache_path: Path) -> List[Path]:
     """
@@ -21,6 +23,38 @@ def find_source_jars(cache_path: Path) -> List[Path]:
     print(f"Found {len(source_jars)} source JAR(s).")
     return source_jars
 
+def _extract_one(jar_path: Path, extract_path: Path) -> Path:
+    """
+    Extracts a single source JAR into extract_path, copying each member with
+    a 1 MiB buffer. The directory tree is created up front from the central
+    directory, so no per-file makedirs is issued. Members with absolute or
+    parent-relative paths are skipped. On failure the partially extracted
+    directory is removed and the error re-raised.
+    """
+    try:
+        with zipfile.ZipFile(jar_path, 'r') as zip_ref:
+            members = []
+            for info in zip_ref.infolist():
+                if info.is_dir():
+                    continue
+                member_path = Path(info.filename)
+                if member_path.is_absolute() or '..' in member_path.parts:
+                    continue
+                members.append((info, extract_path / member_path))
+
+            # One makedirs per distinct directory instead of one per member.
+            dirs = {target.parent for _, target in members}
+            for directory in sorted(dirs):
+                os.makedirs(directory, exist_ok=True)
+
+            for info, target in members:
+                with zip_ref.open(info) as src, open(target, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, length=1 << 20)
+    except Exception:
+        shutil.rmtree(extract_path, ignore_errors=True)
+        raise
+    return extract_path
+
 def extract_and_register_dependencies(source_jars: List[Path], deps_root: Path):
     """
     Extracts source JARs to a target directory and registers them with the Librarian.
@@ -36,6 +70,8 @@ def extract_and_register_dependencies(source_jars: List[Path], deps_root: Path):
     print(f"Extracting dependencies to {deps_root}...")
     deps_root.mkdir(parents=True, exist_ok=True)
     
+    pending: List[Tuple[str, Path, Path]] = []
+    pending_names = set()
     for jar_path in source_jars:
         # Create a unique project name from the JAR file name
         # e.g., commons-lang3-3.12.0
@@ -44,23 +80,37 @@ def extract_and_register_dependencies(source_jars: List[Path], deps_root: Path):
         # Create a subdirectory for this dependency
         extract_path = deps_root / project_name
         
-        if extract_path.exists():
+        # Same artifact-version from different groups maps to the same name;
+        # like an existing directory, only the first JAR is extracted.
+        if project_name in pending_names or extract_path.exists():
             print(f"Dependency '{project_name}' already extracted. Skipping.")
             continue
-        
-        print(f"  Extracting {jar_path.name} to {extract_path}...")
-        try:
-            with zipfile.ZipFile(jar_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_path)
-            
-            # Register this new directory as a project in the Librarian
-            print(f"  Registering '{project_name}' with the Librarian...")
-            add_project(name=project_name, path=extract_path)
-            
-        except zipfile.BadZipFile:
-            print(f"  Warning: Could not extract {jar_path.name}. It may be a corrupted file.")
-        except Exception as e:
-            print(f"  An unexpected error occurred while processing {jar_path.name}: {e}")
+        pending_names.add(project_name)
+        pending.append((project_name, jar_path, extract_path))
+
+    # Extraction is I/O-bound and independent per JAR, so run it concurrently;
+    # registration with the Librarian stays on this thread.
+    extracted: List[Tuple[str, Path]] = []
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = {
+            executor.submit(_extract_one, jar_path, extract_path): (project_name, jar_path)
+            for project_name, jar_path, extract_path in pending
+        }
+        for future in as_completed(futures):
+            project_name, jar_path = futures[future]
+            try:
+                extract_path = future.result()
+                print(f"  Extracted {jar_path.name} to {extract_path}")
+                extracted.append((project_name, extract_path))
+            except zipfile.BadZipFile:
+                print(f"  Warning: Could not extract {jar_path.name}. It may be a corrupted file.")
+            except Exception as e:
+                print(f"  An unexpected error occurred while processing {jar_path.name}: {e}")
+
+    # Register the new directories as projects in the Librarian in one transaction
+    if extracted:
+        print(f"  Registering {len(extracted)} dependencies with the Librarian...")
+        bulk_add_projects(extracted)
 
 if __name__ == "__main__":
     print("--- Running Dependency Manager ---")
@@ -3,100 +3,194 @@
 import sqlite3
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any, Optional
-import yaml
+from typing import List, Dict, Any, Optional, Iterable, Tuple
 import os
+import threading
+import atexit
 
-# --- Configuration Loading (copied from other modules) ---
-def load_config(config_path: Path = Path("config.yaml")) -> Dict[str, Any]:
-    """Loads configuration from a YAML file."""
-    if not config_path.exists():
-        raise FileNotFoundError(f"Configuration file not found at {config_path}")
-    with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
+from .config import CONFIG
 
-CONFIG = load_config()
 DB_PATH = Path(CONFIG["librarian"]["db_path"])
 
 # --- Database Connection ---
-def get_db_connection():
-    """Establishes and returns a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row # Allows accessing columns by name
+# SQLite connections can't be shared across threads, so each thread lazily
+# opens one connection and reuses it for every librarian call.
+_local = threading.local()
+
+def _get_conn() -> sqlite3.Connection:
+    """Returns this thread's connection to the SQLite database, opening it on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row # Allows accessing columns by name
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-20000") # ~20 MiB page cache
+        _local.conn = conn
     return conn
 
+def _close_conn():
+    """Closes this thread's database connection, if one is open."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+atexit.register(_close_conn)
+
+# Project paths rarely change during a session, so lookups are cached by name.
+# add_project/remove_project invalidate the affected entry.
+_PROJECT_PATH_CACHE: Dict[str, Path] = {}
+
 # --- Table Creation ---
 def create_tables():
     """Creates the necessary tables in the database if they don't exist."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS projects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            path TEXT NOT NULL,
-            last_indexed_at TIMESTAMP
-        )
-    """)
-    conn.commit()
-    conn.close()
+    with _get_conn() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS projects (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                path TEXT NOT NULL,
+                last_indexed_at TIMESTAMP
+            )
+        """)
+        # Per-file state from the last semantic index run, used to skip unchanged files.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS file_index (
+                project_id INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                content_hash BLOB NOT NULL,
+                method_ids TEXT NOT NULL,
+                PRIMARY KEY (project_id, path)
+            )
+        """)
+        # Embedding settings the project's file index (and its vectors) were built with.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS index_settings (
+                project_id INTEGER PRIMARY KEY,
+                settings TEXT NOT NULL
+            )
+        """)
     print(f"Database tables ensured for {DB_PATH}.")
 
 # --- CRUD Operations ---
 def add_project(name: str, path: Path) -> Optional[int]:
     """Adds a new project to the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO projects (name, path) VALUES (?, ?)", (name, str(path.resolve())))
-        conn.commit()
-        print(f"Project '{name}' added at '{path}'.")
-        return cursor.lastrowid
-    except sqlite3.IntegrityError:
+    _PROJECT_PATH_CACHE.pop(name, None)
+    with _get_conn() as conn:
+        cursor = conn.execute("INSERT OR IGNORE INTO projects (name, path) VALUES (?, ?)", (name, str(path.resolve())))
+    if cursor.rowcount == 0:
         print(f"Error: Project with name '{name}' already exists.")
         return None
-    finally:
-        conn.close()
+    print(f"Project '{name}' added at '{path}'.")
+    return cursor.lastrowid
+
+def bulk_add_projects(rows: Iterable[Tuple[str, Path]]) -> int:
+    """
+    Adds many (name, path) projects in a single transaction, skipping names
+    that already exist. Returns the number of projects actually added.
+    """
+    rows = [(name, str(path.resolve())) for name, path in rows]
+    for name, _ in rows:
+        _PROJECT_PATH_CACHE.pop(name, None)
+    with _get_conn() as conn:
+        changes_before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO projects (name, path) VALUES (?, ?)", rows)
+        added = conn.total_changes - changes_before
+    print(f"Added {added} of {len(rows)} project(s).")
+    return added
 
 def get_project_path(name: str) -> Optional[Path]:
     """Retrieves the absolute Path for a given project name."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT path FROM projects WHERE name = ?", (name,))
-    row = cursor.fetchone()
-    conn.close()
+    path = _PROJECT_PATH_CACHE.get(name)
+    if path is not None:
+        return path
+    row = _get_conn().execute("SELECT path FROM projects WHERE name = ?", (name,)).fetchone()
     if row:
-        return Path(row['path'])
+        path = _PROJECT_PATH_CACHE[name] = Path(row['path'])
+        return path
     return None
 
 def list_projects() -> List[Dict[str, Any]]:
     """Lists all registered projects."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT name, path, last_indexed_at FROM projects ORDER BY name")
-    projects = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return projects
+    cursor = _get_conn().execute("SELECT name, path, last_indexed_at FROM projects ORDER BY name")
+    return [dict(row) for row in cursor.fetchall()]
 
 def update_project_timestamp(name: str):
     """Updates the 'last_indexed_at' timestamp for a project."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     now = datetime.now().isoformat()
-    cursor.execute("UPDATE projects SET last_indexed_at = ? WHERE name = ?", (now, name))
-    conn.commit()
-    conn.close()
+    with _get_conn() as conn:
+        conn.execute("UPDATE projects SET last_indexed_at = ? WHERE name = ?", (now, name))
     print(f"Project '{name}' last_indexed_at updated to {now}.")
 
 def remove_project(name: str):
-    """Removes a project from the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM projects WHERE name = ?", (name,))
-    conn.commit()
-    conn.close()
+    """Removes a project (and its file index entries) from the database."""
+    _PROJECT_PATH_CACHE.pop(name, None)
+    with _get_conn() as conn:
+        conn.execute("DELETE FROM file_index WHERE project_id = (SELECT id FROM projects WHERE name = ?)", (name,))
+        conn.execute("DELETE FROM index_settings WHERE project_id = (SELECT id FROM projects WHERE name = ?)", (name,))
+        conn.execute("DELETE FROM projects WHERE name = ?", (name,))
     print(f"Project '{name}' removed from the database.")
 
+# --- File Index (Incremental Indexing) ---
+def get_file_index(project_name: str) -> Dict[str, Dict[str, Any]]:
+    """Returns the stored file index entries for a project, keyed by file path."""
+    cursor = _get_conn().execute("""
+        SELECT f.path, f.mtime, f.size, f.content_hash, f.method_ids
+        FROM file_index f JOIN projects p ON p.id = f.project_id
+        WHERE p.name = ?
+    """, (project_name,))
+    return {
+        row['path']: {
+            'mtime': row['mtime'],
+            'size': row['size'],
+            'content_hash': row['content_hash'],
+            'method_ids': row['method_ids'].split(',') if row['method_ids'] else [],
+        }
+        for row in cursor.fetchall()
+    }
+
+def update_file_index(project_name: str, entries: Iterable[Tuple[str, float, int, bytes, List[str]]]):
+    """
+    Inserts or replaces file index entries given as (path, mtime, size, content_hash, method_ids).
+    All entries are written in a single transaction.
+    """
+    with _get_conn() as conn:
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO file_index (project_id, path, mtime, size, content_hash, method_ids)
+            VALUES ((SELECT id FROM projects WHERE name = ?), ?, ?, ?, ?, ?)
+            """,
+            [(project_name, path, mtime, size, content_hash, ','.join(method_ids))
+             for path, mtime, size, content_hash, method_ids in entries]
+        )
+
+def remove_file_index_entries(project_name: str, paths: Iterable[str]):
+    """Removes the file index entries for the given paths of a project in a single transaction."""
+    with _get_conn() as conn:
+        conn.executemany(
+            "DELETE FROM file_index WHERE project_id = (SELECT id FROM projects WHERE name = ?) AND path = ?",
+            [(project_name, path) for path in paths]
+        )
+
+def get_index_settings(project_name: str) -> Optional[str]:
+    """Returns the embedding settings the project was last indexed with, if any."""
+    row = _get_conn().execute("""
+        SELECT s.settings FROM index_settings s JOIN projects p ON p.id = s.project_id
+        WHERE p.name = ?
+    """, (project_name,)).fetchone()
+    return row['settings'] if row else None
+
+def set_index_settings(project_name: str, settings: str):
+    """Records the embedding settings a project's index was built with."""
+    with _get_conn() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO index_settings (project_id, settings) VALUES ((SELECT id FROM projects WHERE name = ?), ?)",
+            (project_name, settings)
+        )
 
 if __name__ == "__main__":
     print("--- Testing Librarian Module ---")
@@ -150,6 +244,7 @@ if __name__ == "__main__":
             print(f"  Name: {p['name']}, Path: {p['path']}, Last Indexed: {p['last_indexed_at']}")
     
     # Clean up the test database file
+    _close_conn()
     if DB_PATH.exists():
         os.remove(DB_PATH)
         print(f"\nCleaned up test database file: {DB_PATH}")
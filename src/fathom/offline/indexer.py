@@ -1,94 +1,199 @@
 # src/fathom/indexer.py
 
 from pathlib import Path
-import yaml
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
+import os
 import hashlib
+import json
+import functools
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from tree_sitter import Node
+import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 import chromadb
 # QueryResult type hint removed as it's not available in this version of chromadb
 
-from .parser import setup_java_parser, get_language
+from ..config import CONFIG
+from .parser import init_parse_worker, parse_java_file
 # Import Librarian for project management
-from .librarian import get_project_path, update_project_timestamp, create_tables
+from .librarian import (
+    get_project_path,
+    update_project_timestamp,
+    create_tables,
+    get_file_index,
+    update_file_index,
+    remove_file_index_entries,
+    get_index_settings,
+    set_index_settings,
+)
 
-# --- Configuration Loading ---
-def load_config(config_path: Path = Path("config.yaml")) -> Dict[str, Any]:
-    """Loads configuration from a YAML file."""
-    if not config_path.exists():
-        raise FileNotFoundError(f"Configuration file not found at {config_path}")
-    with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
-
-CONFIG = load_config()
+# Largest number of records ChromaDB accepts in a single write call; used
+# when the client can't report its own limit.
+CHROMA_MAX_BATCH_SIZE = 5461
 
 # --- File System Utilities ---
-def find_java_files(root_dir: Path) -> List[Path]:
-    """Recursively finds all .java files within a given root directory."""
-    if not root_dir.is_dir():
+def find_java_files(root_dir: Path) -> Iterator[str]:
+    """
+    Recursively yields the paths of all .java files within a given root directory.
+
+    Walks with os.scandir, which reuses the directory entry's cached type
+    information, and yields plain strings so no Path objects are built.
+    """
+    if not os.path.isdir(root_dir):
         raise ValueError(f"Root directory not found: {root_dir}")
-    return list(root_dir.rglob("*.java"))
+    stack = [str(root_dir)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except PermissionError:
+            continue  # Unreadable directories are skipped, as Path.rglob does
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".java"):
+                    yield entry.path
 
-# --- Tree-sitter Parsing and Extraction ---
-def extract_method_info(root_node: Node, source_code: bytes, file_path: Path) -> List[Dict[str, Any]]:
+# --- Method IDs ---
+def compute_method_ids(file_path: str, methods: List[Dict[str, Any]]) -> List[str]:
     """
-    Extracts method information from a Tree-sitter root node.
+    Derives a stable ID for each method from its file path, class name,
+    method name and start line (NUL-separated). The shared file and class
+    prefix is hashed once and the hasher cloned per method.
     """
-    methods_info = []
-    language = get_language("java")
-    query_string = "(method_declaration) @method"
-    method_query = language.query(query_string)
-    method_nodes = method_query.captures(root_node)
-
-    for node, _ in method_nodes:
-        method_data = { "file_path": str(file_path), "class_name": "N/A" }
-        name_node = node.child_by_field_name("name")
-        body_node = node.child_by_field_name("body")
-        
-        parent = node.parent
-        while parent:
-            if parent.type == 'class_declaration':
-                class_name_node = parent.child_by_field_name('name')
-                if class_name_node:
-                    method_data['class_name'] = class_name_node.text.decode('utf-8')
-                break
-            parent = parent.parent
-
-        if name_node and body_node:
-            method_data.update({
-                'method_name': name_node.text.decode('utf-8'),
-                'code': body_node.text.decode('utf-8'),
-                'start_line': body_node.start_point[0] + 1,
-                'end_line': body_node.end_point[0] + 1,
-            })
-            params_node = node.child_by_field_name("parameters")
-            if params_node:
-                 method_data['parameters'] = params_node.text.decode('utf-8')
-            type_node = node.child_by_field_name("type")
-            if type_node:
-                method_data['return_type'] = type_node.text.decode('utf-8')
-            methods_info.append(method_data)
-    return methods_info
-    
+    file_hasher = hashlib.blake2b(file_path.encode() + b'\x00', digest_size=16)
+    class_hashers = {}
+    method_ids = []
+    for method in methods:
+        class_name = method.get('class_name', '')
+        class_hasher = class_hashers.get(class_name)
+        if class_hasher is None:
+            class_hasher = file_hasher.copy()
+            class_hasher.update(class_name.encode() + b'\x00')
+            class_hashers[class_name] = class_hasher
+        hasher = class_hasher.copy()
+        hasher.update(f"{method.get('method_name', '')}\x00{method.get('start_line', '')}".encode())
+        method_ids.append(hasher.hexdigest())
+    return method_ids
+
 # --- Embedding Model Loading ---
+def _select_device() -> str:
+    """Returns the configured embedding device, or the best available one."""
+    device = CONFIG["indexing"].get("device")
+    if device:
+        return device
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+@functools.lru_cache(maxsize=1)
 def load_embedding_model() -> SentenceTransformer:
     """Loads the sentence transformer model specified in the config."""
     model_name = CONFIG["indexing"]["embedding_model"]
-    print(f"Loading embedding model: {model_name}...")
-    model = SentenceTransformer(model_name)
+    device = _select_device()
+    print(f"Loading embedding model: {model_name} on {device}...")
+    model = SentenceTransformer(model_name, device=device)
     print("Embedding model loaded successfully.")
     return model
 
+def encode_documents(embedding_model: SentenceTransformer, documents: List[str]):
+    """
+    Encodes documents in one call using the configured batch size and
+    normalization. If `multiprocess_devices` is set, encoding is spread
+    across those devices with a multi-process pool. The result is cast to
+    float16 when `embedding_precision` asks for it.
+    """
+    indexing_config = CONFIG["indexing"]
+    devices = indexing_config.get("multiprocess_devices")
+    if devices:
+        pool = embedding_model.start_multi_process_pool(target_devices=devices)
+        try:
+            embeddings = embedding_model.encode_multi_process(
+                documents,
+                pool,
+                batch_size=indexing_config["batch_size"],
+                normalize_embeddings=indexing_config["normalize_embeddings"],
+            )
+        finally:
+            embedding_model.stop_multi_process_pool(pool)
+    else:
+        embeddings = embedding_model.encode(
+            documents,
+            batch_size=indexing_config["batch_size"],
+            convert_to_numpy=True,
+            normalize_embeddings=indexing_config["normalize_embeddings"],
+            show_progress_bar=True,
+        )
+    if indexing_config.get("embedding_precision") == "float16":
+        embeddings = embeddings.astype(np.float16)
+    return embeddings
+
 # --- ChromaDB Client Setup ---
+@functools.lru_cache(maxsize=1)
 def setup_chroma_client() -> chromadb.Client:
-    """Sets up the ChromaDB client."""
+    """Sets up the ChromaDB client. The client is created once per process and reused."""
     chroma_db_path = CONFIG["indexing"]["chroma_db_path"]
     print(f"Connecting to ChromaDB at path: {chroma_db_path}")
     client = chromadb.PersistentClient(path=str(chroma_db_path))
     return client
 
+# Characters not allowed in ChromaDB collection names, mapped in one pass.
+_COLLECTION_NAME_SANITIZE = str.maketrans({'.': '-', '/': '-'})
+
+@functools.lru_cache(maxsize=128)
+def _collection_name(project_root: Path) -> str:
+    """Returns the ChromaDB collection name for a project root."""
+    return f"fathom-code-snippets-{project_root.name.translate(_COLLECTION_NAME_SANITIZE)}"
+
+# Collections resolved for search, keyed by collection name.
+_COLLECTION_CACHE: Dict[str, Any] = {}
+
+def get_search_collection(project_root: Path):
+    """
+    Returns the existing ChromaDB collection for a project, caching it so
+    repeat searches go straight to collection.query(). Raises if the
+    project has not been indexed.
+    """
+    collection_name = _collection_name(project_root)
+    collection = _COLLECTION_CACHE.get(collection_name)
+    if collection is None:
+        collection = setup_chroma_client().get_collection(name=collection_name)
+        _COLLECTION_CACHE[collection_name] = collection
+    return collection
+
+def _max_batch_size(client) -> int:
+    """Returns the client's per-call write limit, falling back to CHROMA_MAX_BATCH_SIZE."""
+    get_max_batch_size = getattr(client, "get_max_batch_size", None)
+    if get_max_batch_size is not None:
+        try:
+            return get_max_batch_size()
+        except Exception:
+            pass
+    return getattr(client, "max_batch_size", None) or CHROMA_MAX_BATCH_SIZE
+
+def _upsert_batch(collection, ids: List[str], embeddings: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]]):
+    """
+    Upserts one batch, passing the embeddings ndarray straight through so no
+    Python list of floats is materialized. Chroma releases that only accept
+    lists of lists get a converted copy instead.
+    """
+    try:
+        collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+    except (TypeError, ValueError):
+        collection.upsert(ids=ids, embeddings=embeddings.tolist(), documents=documents, metadatas=metadatas)
+
+def _embedding_settings() -> str:
+    """Returns the settings that determine a method's vector, as a stable string."""
+    indexing_config = CONFIG["indexing"]
+    return json.dumps({
+        "embedding_model": indexing_config["embedding_model"],
+        "normalize_embeddings": indexing_config["normalize_embeddings"],
+        "embedding_precision": indexing_config.get("embedding_precision", "float32"),
+    }, sort_keys=True)
+
 # --- Main Indexing Logic (Librarian Integrated) ---
 def index_project(project_name: str): # Accepts project_name now
     """Main function to index a given project by name."""
@@ -102,46 +207,140 @@ def index_project(project_name: str): # Accepts project_name now
         print(f"Error: Project '{project_name}' not found in Librarian. Please add it first.")
         return
 
-    java_files = find_java_files(project_root)
+    # An empty project still falls through, so methods of files that have
+    # since been deleted are removed from Chroma and the file index.
+    java_files = list(find_java_files(project_root))
     if not java_files:
-        print(f"No Java files found in {project_root}. Exiting.")
-        return
+        print(f"No Java files found in {project_root}.")
 
-    parser = setup_java_parser()
-    embedding_model = load_embedding_model()
-    chroma_client = setup_chroma_client()
+    # Vectors built with another model or encoding can't be mixed with new
+    # ones, so the file index only counts if the settings still match.
+    settings = _embedding_settings()
+    file_index = get_file_index(project_name)
+    settings_changed = get_index_settings(project_name) != settings
+    known_index = {} if settings_changed else file_index
+    if settings_changed and file_index:
+        print("Embedding settings changed since the last run; re-indexing every file.")
+
+    # Files whose mtime and size match the last run are skipped without being
+    # read; the rest are hashed in the workers and only parsed if changed.
+    current_paths = set()
+    files_to_check = []
+    reused_files = []  # (file_path, stat) of files whose stored methods are kept
+    for file_path in java_files:
+        current_paths.add(file_path)
+        stat = os.stat(file_path)
+        entry = known_index.get(file_path)
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            reused_files.append((file_path, stat))
+            continue
+        files_to_check.append((file_path, stat, entry))
+
+    documents_to_add, metadatas_to_add, ids_to_add = [], [], []
+    file_index_updates = {}
+    stale_ids = []
 
-    from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-    embedding_function = SentenceTransformerEmbeddingFunction(model_name=CONFIG["indexing"]["embedding_model"])
+    def add_file_methods(file_path, stat, entry, content_hash, methods_data):
+        """Queues a parsed file's methods for embedding and its new file index entry."""
+        print(f"Processed file: {file_path}")
+        method_ids = compute_method_ids(file_path, methods_data)
+        for method in methods_data:
+            # Move the code out so the remaining dict is the metadata itself.
+            documents_to_add.append(method.pop('code'))
+            metadatas_to_add.append(method)
+        ids_to_add.extend(method_ids)
+        if entry:
+            stale_ids.extend(set(entry['method_ids']) - set(method_ids))
+        file_index_updates[file_path] = (file_path, stat.st_mtime, stat.st_size, content_hash, method_ids)
 
-    collection_name = f"fathom-code-snippets-{project_root.name.replace('.', '-').replace('/', '-')}"
-    collection = chroma_client.get_or_create_collection(
-        name=collection_name,
-        embedding_function=embedding_function
-    )
+    # Phase 1: parse files in parallel across CPU cores; only the main
+    # process touches the collected lists and, later, the Chroma store.
+    with ProcessPoolExecutor(initializer=init_parse_worker) as executor:
+        futures = {
+            executor.submit(parse_java_file, file_path, entry['content_hash'] if entry else None): (file_path, stat, entry)
+            for file_path, stat, entry in files_to_check
+        }
+        for future in as_completed(futures):
+            file_path, stat, entry = futures[future]
+            try:
+                content_hash, methods_data = future.result()
+            except Exception as e:
+                print(f"  Warning: Failed to parse {file_path}: {e}")
+                continue
+            if methods_data is None:
+                # Touched but unchanged: refresh the stat info, keep the methods.
+                file_index_updates[file_path] = (file_path, stat.st_mtime, stat.st_size, content_hash, entry['method_ids'])
+                reused_files.append((file_path, stat))
+                continue
+            add_file_methods(file_path, stat, entry, content_hash, methods_data)
+
+    # The model and client are only set up once the pool has finished: both
+    # start threads, and a worker forked while one holds a lock can deadlock.
+    chroma_client = setup_chroma_client()
+
+    # Embeddings are computed here and passed in directly, so the collection
+    # is created without an embedding_function to avoid embedding twice.
+    collection_name = _collection_name(project_root)
+    if settings_changed:
+        try:
+            chroma_client.delete_collection(name=collection_name)
+        except Exception:
+            pass  # Nothing indexed yet
+    collection = chroma_client.get_or_create_collection(name=collection_name)
+    _COLLECTION_CACHE[collection_name] = collection
     print(f"Using ChromaDB collection: {collection_name}")
-    total_indexed_methods = 0
+    batch_size = _max_batch_size(chroma_client)
 
-    for file_path in java_files:
-        print(f"Processing file: {file_path}")
-        with open(file_path, "rb") as f:
-            source_code_bytes = f.read()
-        tree = parser.parse(source_code_bytes)
-        methods_data = extract_method_info(tree.root_node, source_code_bytes, file_path)
-        if methods_data:
-            documents_to_add, metadatas_to_add, ids_to_add = [], [], []
-            for method in methods_data:
-                unique_str = f"{method['file_path']}-{method.get('class_name', '')}-{method.get('method_name', '')}-{method.get('start_line', '')}"
-                method_id = hashlib.sha256(unique_str.encode()).hexdigest()
-                documents_to_add.append(method['code'])
-                metadatas_to_add.append({key: val for key, val in method.items() if key != 'code'})
-                ids_to_add.append(method_id)
-            if documents_to_add:
-                embeddings = embedding_model.encode(documents_to_add).tolist()
-                collection.add(embeddings=embeddings, documents=documents_to_add, metadatas=metadatas_to_add, ids=ids_to_add)
-                total_indexed_methods += len(documents_to_add)
-                print(f"  Indexed {len(documents_to_add)} methods from {file_path}")
-    print(f"\nFinished indexing project. Total methods indexed: {total_indexed_methods}")
+    # The file index claims vectors exist for the reused files; if the
+    # collection is empty (e.g. the Chroma directory was deleted), they have
+    # to be parsed after all. The pool is gone by now, so this runs here.
+    if any(known_index[path]['method_ids'] for path, _ in reused_files) and collection.count() == 0:
+        print(f"ChromaDB collection is empty; re-indexing {len(reused_files)} unchanged files.")
+        for file_path, stat in reused_files:
+            try:
+                content_hash, methods_data = parse_java_file(file_path)
+            except Exception as e:
+                print(f"  Warning: Failed to parse {file_path}: {e}")
+                continue
+            add_file_methods(file_path, stat, None, content_hash, methods_data)
+        reused_files = []
+
+    # Files that disappeared since the last run take their methods with them.
+    # After a settings change, entries that weren't re-indexed are dropped too.
+    removed_paths = [
+        path for path in file_index
+        if path not in current_paths or (settings_changed and path not in file_index_updates)
+    ]
+    for path in removed_paths:
+        stale_ids.extend(known_index.get(path, {}).get('method_ids', ()))
+
+    if stale_ids:
+        print(f"Removing {len(stale_ids)} stale methods...")
+        for i in range(0, len(stale_ids), batch_size):
+            collection.delete(ids=stale_ids[i:i + batch_size])
+
+    # Phase 2: embed everything in a single encode call, then write to Chroma
+    # in as few calls as its per-call limit allows.
+    if documents_to_add:
+        print(f"Encoding {len(documents_to_add)} methods...")
+        embeddings = encode_documents(load_embedding_model(), documents_to_add)
+        for i in range(0, len(ids_to_add), batch_size):
+            _upsert_batch(
+                collection,
+                ids=ids_to_add[i:i + batch_size],
+                embeddings=embeddings[i:i + batch_size],
+                documents=documents_to_add[i:i + batch_size],
+                metadatas=metadatas_to_add[i:i + batch_size],
+            )
+
+    # Only record files once their methods are safely in Chroma.
+    update_file_index(project_name, file_index_updates.values())
+    remove_file_index_entries(project_name, removed_paths)
+    set_index_settings(project_name, settings)
+
+    skipped_files = len(reused_files)
+    print(f"\nFinished indexing project. Methods indexed: {len(documents_to_add)}, "
+          f"unchanged files skipped: {skipped_files}, removed files: {len(removed_paths)}")
     
     # --- LIBRARIAN INTEGRATION: Update timestamp ---
     update_project_timestamp(project_name)
@@ -151,18 +350,30 @@ def index_project(project_name: str): # Accepts project_name now
 # --- SEMANTIC SEARCH FUNCTION ---
 def semantic_search(project_root: Path, query: str, n_results: int = 5):
     """Performs a semantic search on an indexed project."""
-    chroma_client = setup_chroma_client()
-    collection_name = f"fathom-code-snippets-{project_root.name.replace('.', '-').replace('/', '-')}"
-    
-    print(f"Querying ChromaDB collection: {collection_name}")
     try:
-        collection = chroma_client.get_collection(name=collection_name)
+        collection = get_search_collection(project_root)
     except Exception as e:
-        print(f"Error getting collection {collection_name}: {e}")
+        print(f"Error getting collection for {project_root.name}: {e}")
         return None
 
-    results = collection.query(query_texts=[query], n_results=n_results)
-    return results
+    # The collection has no embedding_function, so embed the query with the
+    # same model (and normalization) used at indexing time.
+    embedding_model = load_embedding_model()
+    query_embedding = embedding_model.encode(
+        [query], convert_to_numpy=True, normalize_embeddings=CONFIG["indexing"]["normalize_embeddings"]
+    ).tolist()
+    try:
+        return collection.query(query_embeddings=query_embedding, n_results=n_results)
+    except Exception:
+        # Re-indexing may have deleted and recreated the collection since it
+        # was cached; drop the stale handle and fetch the current one once.
+        _COLLECTION_CACHE.pop(_collection_name(project_root), None)
+    try:
+        collection = get_search_collection(project_root)
+    except Exception as e:
+        print(f"Error getting collection for {project_root.name}: {e}")
+        return None
+    return collection.query(query_embeddings=query_embedding, n_results=n_results)
 
 
 if __name__ == "__main__":
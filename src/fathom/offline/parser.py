@@ -1,8 +1,12 @@
 # src/fathom/parser.py (Corrected parser using tree_sitter_languages)
 
 from pathlib import Path
-from tree_sitter import Parser
-from tree_sitter_languages import get_language, get_parser
+import os
+import hashlib
+import functools
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from tree_sitter import Language, Node, Parser, Tree
 
 # Define paths - used mainly for the example and to ensure consistency
 # The grammar_dir and build_lib_path are no longer strictly needed for this
@@ -11,6 +15,14 @@ from tree_sitter_languages import get_language, get_parser
 grammar_dir = Path(__file__).parent.parent.parent / ".fathom_grammars"
 build_lib_path = grammar_dir / "fathom_grammars.so"
 
+# tree_sitter_languages loads a large shared library, so it is imported on
+# first use rather than when this module is imported.
+@functools.lru_cache(maxsize=None)
+def get_language(name: str) -> Language:
+    """Returns the tree-sitter Language for `name`, loading it once per process."""
+    from tree_sitter_languages import get_language as _get_language
+    return _get_language(name)
+
 def setup_java_parser() -> Parser:
     """
     Sets up and returns a tree-sitter Parser instance configured for Java.
@@ -20,12 +32,186 @@ def setup_java_parser() -> Parser:
     """
     # Get the Java language object and parser instance directly
     # `get_parser()` automatically loads and configures the parser for the specified language
+    from tree_sitter_languages import get_parser
     java_parser = get_parser("java")
     return java_parser
 
-# Create a singleton parser instance to be imported by other modules
-# This variable name needs to be unique if both parser.py and parser_fixed.py are imported
-java_parser = setup_java_parser()
+# Compiled queries keyed by (language name, pattern); compiling a query
+# builds a grammar-dependent state machine, so it's only done once.
+_QUERY_CACHE: Dict[Tuple[str, str], Any] = {}
+
+def get_query(lang_name: str, pattern: str) -> Any:
+    """Returns the compiled tree-sitter Query for a pattern, compiling it on first use."""
+    key = (lang_name, pattern)
+    query = _QUERY_CACHE.get(key)
+    if query is None:
+        query = _QUERY_CACHE[key] = get_language(lang_name).query(pattern)
+    return query
+
+@functools.lru_cache(maxsize=None)
+def get_java_parser() -> Parser:
+    """Returns the shared Java parser, creating it on first use."""
+    return setup_java_parser()
+
+# --- Method Extraction ---
+# The query is constant, so compile it once per process instead of once per
+# file. A single pass captures class names and every method field, replacing
+# the per-field child_by_field_name lookups; the ancestor walk for a method's
+# owner only has to stop at class declarations the query captured.
+_METHOD_QUERY_PATTERN = """
+    (class_declaration name: (identifier) @class_name)
+    (method_declaration
+        type: (_) @return_type
+        name: (identifier) @method_name
+        parameters: (formal_parameters) @parameters
+        body: (block) @body) @method
+"""
+
+def extract_method_info(root_node: Node, source_code: bytes, file_path: str) -> List[Dict[str, Any]]:
+    """
+    Extracts method information from a Tree-sitter root node.
+    """
+    methods_info = []
+    class_names = {}  # class_declaration node id -> class name
+    methods = {}      # method_declaration node id -> method_data
+
+    # Captures arrive in document order, so a class name is always seen
+    # before the methods declared in its body.
+    for node, tag in get_query("java", _METHOD_QUERY_PATTERN).captures(root_node):
+        if tag == "class_name":
+            class_names[node.parent.id] = node.text.decode('utf-8')
+        elif tag == "method":
+            # Usually the class_body's parent, but methods in anonymous classes,
+            # enums or interfaces belong to the nearest enclosing class.
+            owner = node.parent
+            while owner is not None and owner.id not in class_names:
+                owner = owner.parent
+            method_data = {
+                "file_path": file_path,
+                "class_name": class_names[owner.id] if owner is not None else "N/A",
+            }
+            methods[node.id] = method_data
+            methods_info.append(method_data)
+        else:
+            method_data = methods[node.parent.id]
+            if tag == "body":
+                method_data.update({
+                    'code': node.text.decode('utf-8'),
+                    'start_line': node.start_point[0] + 1,
+                    'end_line': node.end_point[0] + 1,
+                })
+            else:
+                method_data[tag] = node.text.decode('utf-8')
+    return methods_info
+    
+# --- Parallel Parsing Workers ---
+# The indexer runs these in a process pool. They live here rather than in
+# indexer.py so spawned workers don't import torch, sentence_transformers
+# and chromadb just to parse Java.
+def init_parse_worker():
+    """ProcessPoolExecutor initializer: builds this worker's Java parser and query up front."""
+    get_java_parser()
+    get_query("java", _METHOD_QUERY_PATTERN)
+
+def parse_java_file(file_path: str, known_hash: Optional[bytes] = None) -> Tuple[bytes, Optional[List[Dict[str, Any]]]]:
+    """
+    Reads and parses a single Java file in a worker.
+
+    Returns the file's content hash and its extracted methods. If the hash
+    equals `known_hash` the file is unchanged and is not parsed (methods is None).
+    """
+    source_code_bytes = Path(file_path).read_bytes()
+    content_hash = hashlib.blake2b(source_code_bytes, digest_size=16).digest()
+    if content_hash == known_hash:
+        return content_hash, None
+    tree = get_java_parser().parse(source_code_bytes)
+    return content_hash, extract_method_info(tree.root_node, source_code_bytes, file_path)
+
+# --- Incremental Re-parsing ---
+def _common_prefix_len(a: bytes, b: bytes) -> int:
+    """Length of the common prefix of a and b, found by bisecting with C-level slice compares."""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def _point_at(source: bytes, offset: int) -> Tuple[int, int]:
+    """Returns the tree-sitter (row, column) point of a byte offset."""
+    row = source.count(b"\n", 0, offset)
+    column = offset - (source.rfind(b"\n", 0, offset) + 1)
+    return (row, column)
+
+class JavaFileCache:
+    """
+    Keeps the last source and syntax tree of each parsed Java file. When a
+    file changes, the differing byte range is applied to the old tree with
+    Tree.edit() and the file is re-parsed against it, so tree-sitter reuses
+    every unaffected subtree and the cost scales with the edit, not the file.
+
+    Tree.edit() works in place and tree-sitter 0.20 can't copy a Tree, so a
+    tree returned by parse() is only valid until the next parse() of the same
+    file: after that its node positions are shifted. Callers must not hold
+    on to trees across parses. At most `max_entries` files are kept; the
+    least recently parsed are evicted first.
+    """
+
+    def __init__(self, parser: Optional[Parser] = None, max_entries: int = 256):
+        # A dedicated parser by default: Parser objects aren't thread-safe.
+        self._parser = parser or setup_java_parser()
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, bytes, Tree]]" = OrderedDict()
+
+    def parse(self, file_path) -> Tree:
+        """
+        Returns the syntax tree for file_path, re-parsing incrementally if it
+        changed. The tree is invalidated by the next parse() of this file.
+        """
+        path = str(file_path)
+        mtime = os.stat(path).st_mtime_ns
+        entry = self._entries.get(path)
+        if entry and entry[0] == mtime:
+            self._entries.move_to_end(path)
+            return entry[2]
+        with open(path, "rb") as f:
+            source = f.read()
+        tree = self._reparse(entry, source)
+        self._entries[path] = (mtime, source, tree)
+        self._entries.move_to_end(path)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        return tree
+
+    def invalidate(self, file_path):
+        """Drops the cached tree for file_path."""
+        self._entries.pop(str(file_path), None)
+
+    def _reparse(self, entry: Optional[Tuple[int, bytes, Tree]], source: bytes) -> Tree:
+        if entry is None:
+            return self._parser.parse(source)
+        _, old_source, old_tree = entry
+        if old_source == source:
+            return old_tree
+
+        # The edit is the span between the common prefix and common suffix.
+        start = _common_prefix_len(old_source, source)
+        max_suffix = min(len(old_source), len(source)) - start
+        suffix = _common_prefix_len(old_source[::-1][:max_suffix], source[::-1][:max_suffix])
+        old_end = len(old_source) - suffix
+        new_end = len(source) - suffix
+        old_tree.edit(
+            start_byte=start,
+            old_end_byte=old_end,
+            new_end_byte=new_end,
+            start_point=_point_at(old_source, start),
+            old_end_point=_point_at(old_source, old_end),
+            new_end_point=_point_at(source, new_end),
+        )
+        return self._parser.parse(source, old_tree)
+
 
 if __name__ == "__main__":
     # Example usage: Parse the sample Java file and print its syntax tree
@@ -50,8 +236,6 @@ if __name__ == "__main__":
         print(root_node.sexp())
 
         # Example of querying the tree (similar to the provided examples)
-        language = get_language("java") # Get the language object for querying
-        
         # Query for all method declarations
         method_pattern = """
             (method_declaration
@@ -60,7 +244,7 @@ if __name__ == "__main__":
                 body: (block) @method_body
             )
         """
-        method_query = language.query(method_pattern)
+        method_query = get_query("java", method_pattern)
         method_captures = method_query.captures(root_node)
 
         print("\n--- Captured Method Declarations ---")
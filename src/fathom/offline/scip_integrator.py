@@ -2,19 +2,9 @@
 
 from pathlib import Path
 import subprocess
-import yaml
-import os
-from typing import Dict, Any, Optional
+from typing import Optional
 
-# --- Configuration Loading ---
-def load_config(config_path: Path = Path("config.yaml")) -> Dict[str, Any]:
-    """Loads configuration from a YAML file."""
-    if not config_path.exists():
-        raise FileNotFoundError(f"Configuration file not found at {config_path}")
-    with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
-
-CONFIG = load_config()
+from ..config import get_config
 
 def run_scip_java_index(project_root: Path, output_file: Path = Path("index.scip")) -> Optional[Path]:
     """
@@ -27,19 +17,14 @@ def run_scip_java_index(project_root: Path, output_file: Path = Path("index.scip
     Returns:
         The path to the generated index.scip file if successful, otherwise None.
     """
-    if not project_root.is_dir():
-        print(f"Error: Project root not found or is not a directory: {project_root}")
-        return None
-    
     # --- FIX: Make the output path absolute ---
     # Resolve the path relative to the current working directory to get an absolute path.
-    scip_output_dir = Path(CONFIG["indexing"]["scip_index_path"]).resolve()
+    scip_output_dir = Path(get_config()["indexing"]["scip_index_path"]).resolve()
     scip_output_dir.mkdir(parents=True, exist_ok=True)
     
     # Define the full, absolute output path for the index file
     full_output_path = scip_output_dir / output_file
 
-    original_cwd = Path.cwd()
     try:
         print(f"Running 'scip-java index' for project: {project_root.name}")
         print(f"Outputting SCIP index to: {full_output_path}")
@@ -63,7 +48,14 @@ def run_scip_java_index(project_root: Path, output_file: Path = Path("index.scip
         print(f"Successfully ran scip-java. Output file should be at {full_output_path}")
         return full_output_path
         
-    except FileNotFoundError:
+    except NotADirectoryError:
+        print(f"Error: Project root not found or is not a directory: {project_root}")
+        return None
+    except FileNotFoundError as e:
+        # Raised for a missing cwd as well as a missing executable.
+        if e.filename == project_root:
+            print(f"Error: Project root not found or is not a directory: {project_root}")
+            return None
         print("Error: scip-java command not found.")
         print("Please ensure scip-java is installed and available in your system's PATH.")
         return None
@@ -75,5 +67,4 @@ def run_scip_java_index(project_root: Path, output_file: Path = Path("index.scip
     except Exception as e:
         print(f"An unexpected error occurred during scip-java indexing: {e}")
         return None
-    finally:
-        os.chdir(original_cwd)
+
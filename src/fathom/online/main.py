@@ -7,10 +7,10 @@ from pathlib import Path
 from typing import List, Dict, Any, Literal
 
 # Import Librarian for project management
-from .librarian import get_project_path, create_tables
+from .librarian import get_project_path, create_tables, list_projects
 
 # Import our backend search functions
-from .indexer import semantic_search
+from .indexer import semantic_search, get_search_collection
 from .searcher import literal_search
 from .scip_querier import structural_search # Import the ROBUST structural search
 
@@ -36,10 +36,18 @@ app = FastAPI(
 # --- FastAPI Startup Event ---
 @app.on_event("startup")
 async def startup_event():
-    """Ensure database tables are created on startup."""
+    """Ensure database tables are created and warm the ChromaDB collection cache on startup."""
     print("FastAPI app starting up. Ensuring Librarian database tables exist...")
     create_tables()
     print("Librarian database tables checked.")
+    # Resolve every indexed project's collection up front so the first
+    # semantic search doesn't pay for opening the ChromaDB client.
+    for project in list_projects():
+        try:
+            get_search_collection(Path(project['path']))
+        except Exception:
+            # Not semantically indexed yet; it will be resolved on first search.
+            pass
 
 # --- API Endpoint ---
 @app.post("/search", response_model=SearchResponse)
@@ -68,7 +76,7 @@ async def search(request: SearchRequest):
 
         elif request.search_type == "literal":
             print(f"Performing literal search for: '{request.query}' in project '{request.project_name}'")
-            results = literal_search(project_root, request.query)
+            results = [match.to_dict() for match in literal_search(project_root, request.query)]
             return SearchResponse(search_type="literal", results=results)
 
         elif request.search_type == "structural":
@@ -2,125 +2,287 @@
 
 from pathlib import Path
 import os
-from typing import List, Dict, Any, Optional
+import functools
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
 
 # Import the generated protobuf classes
 from . import scip_pb2
 
-# --- SCIP Symbol Parsing ---
-# (parse_scip_symbol function remains, though not directly used in this search)
-def parse_scip_symbol(symbol: str) -> Optional[Dict[str, Any]]:
-    """
-    Parses a SCIP symbol string into its components.
-    Example: 'semanticdb maven maven/com.example/sample-java-project 1.0-SNAPSHOT com/example/Main#greet().'
-    This is a simplified parser for demonstration. A full parser would handle all descriptor types.
-    """
-    if symbol.startswith('local '):
-        return {'type': 'local', 'id': symbol.split(' ')[1]}
+# Deserializing a large index is dominated by the protobuf backend. The
+# native one (upb) is the default; the pure-Python fallback is many times
+# slower, so say so when it's the one in use.
+try:
+    from google.protobuf.internal import api_implementation
+    if api_implementation.Type() == "python":
+        print("Warning: protobuf is using its pure-Python implementation; "
+              "loading SCIP indexes will be slow.")
+except ImportError:
+    pass
 
-    try:
-        parts = symbol.split(' ')
-        scheme = parts[0]
-        # Skip package info for now as it's static for our test project
-        # manager = parts[1]
-        # package_name = parts[2]
-        # version = parts[3]
-        
-        # The actual fully qualified name (FQN) part starts from index 4
-        fqn_part = parts[4] 
-        
-        # Simplified descriptor parsing for demonstration
-        # This part of the code needs to be truly robust for general SCIP parsing.
-        descriptors = []
-        # Example to extract descriptor names (very basic)
-        if '#' in fqn_part:
-            descriptors.append(fqn_part.split('#')[0] + '#') # Class
-            descriptors.append(fqn_part.split('#')[1]) # Method/Field
+# --- Lazy Document Decoding ---
+# An Index is one message whose documents are length-prefixed field-2
+# entries, so a single pass over the wire bytes can locate every Document
+# (and read its relative_path) without materializing any occurrences.
+_INDEX_DOCUMENTS_FIELD = 2
+_DOCUMENT_RELATIVE_PATH_KEY = (1 << 3) | 2  # field 1, length-delimited
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Decodes a base-128 varint at pos; returns (value, next position)."""
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def _skip_field(data: bytes, pos: int, wire_type: int) -> int:
+    """Returns the position just past a field value of the given wire type."""
+    if wire_type == 0:
+        return _read_varint(data, pos)[1]
+    if wire_type == 1:
+        return pos + 8
+    if wire_type == 2:
+        length, pos = _read_varint(data, pos)
+        return pos + length
+    if wire_type == 5:
+        return pos + 4
+    raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+
+def _document_relative_path(data: bytes, pos: int, end: int) -> str:
+    """Reads relative_path from the Document encoded in data[pos:end]."""
+    while pos < end:
+        key, pos = _read_varint(data, pos)
+        if key == _DOCUMENT_RELATIVE_PATH_KEY:
+            length, pos = _read_varint(data, pos)
+            return data[pos:pos + length].decode('utf-8')
+        pos = _skip_field(data, pos, key & 7)
+    return ""
+
+def _scan_documents(data: bytes) -> List[Tuple[str, int, int]]:
+    """Returns (relative_path, offset, length) for every Document in a serialized Index."""
+    documents = []
+    pos, end = 0, len(data)
+    while pos < end:
+        key, pos = _read_varint(data, pos)
+        wire_type = key & 7
+        if key >> 3 == _INDEX_DOCUMENTS_FIELD and wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            documents.append((_document_relative_path(data, pos, pos + length), pos, length))
+            pos += length
         else:
-            descriptors.append(fqn_part)
-
-        return {
-            'type': 'global',
-            'scheme': scheme,
-            # 'package': {'manager': manager, 'name': package_name, 'version': version},
-            'descriptors_str': fqn_part, # Storing the direct FQN part for now
-            'descriptors': descriptors # Simplified
+            pos = _skip_field(data, pos, wire_type)
+    return documents
+
+# --- Index Cache ---
+# Everything derived from one index.scip file (raw bytes, Document offsets,
+# parsed Index, definition tables) lives in a single entry per path. When
+# the file's (mtime, size) changes the entry is replaced wholesale, so older
+# versions aren't kept alive.
+_MAX_CACHED_INDEXES = 8
+_MAX_CACHED_PACKAGES = 64  # package-scoped definition tables per index
+_INDEX_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+def _get_index_entry(scip_index_path: Path) -> Dict[str, Any]:
+    """
+    Returns the cache entry for an index.scip file, reading it and locating
+    its Documents if the file is new or changed on disk.
+    Raises FileNotFoundError if the file doesn't exist.
+    """
+    path = str(scip_index_path)
+    stat = os.stat(path)
+    version = (stat.st_mtime, stat.st_size)
+    entry = _INDEX_CACHE.get(path)
+    if entry is None or entry["version"] != version:
+        with open(path, "rb") as f:
+            data = f.read()
+        entry = {
+            "version": version,
+            "data": data,
+            "documents": _scan_documents(data),
+            "index": None,
+            "definitions": None,
+            "packages": OrderedDict(),
         }
-    except IndexError:
-        # Malformed symbol string
-        return None
+        _INDEX_CACHE[path] = entry
+        while len(_INDEX_CACHE) > _MAX_CACHED_INDEXES:
+            _INDEX_CACHE.popitem(last=False)
+    _INDEX_CACHE.move_to_end(path)
+    return entry
 
 # --- Main SCIP Querier Logic ---
 def load_scip_index(scip_index_path: Path) -> Optional[scip_pb2.Index]:
-    """Loads and parses an index.scip file into a scip_pb2.Index object."""
-    if not scip_index_path.exists():
+    """
+    Loads and parses an index.scip file into a scip_pb2.Index object. The
+    result is cached until the file on disk changes.
+    """
+    try:
+        entry = _get_index_entry(scip_index_path)
+        if entry["index"] is None:
+            scip_index = scip_pb2.Index()
+            scip_index.ParseFromString(entry["data"])
+            entry["index"] = scip_index
+        return entry["index"]
+    except FileNotFoundError:
         print(f"Error: SCIP index file not found at {scip_index_path}")
         return None
+    except Exception as e:
+        print(f"Error parsing SCIP index file {scip_index_path}: {e}")
+        return None
+
+# --- Definition Index ---
+def _definition_key(symbol: str) -> str:
+    """
+    Returns the innermost "Type#member" part of a SCIP symbol, e.g.
+    '... com/example/Main#greet().' -> 'Main#greet().'
+    """
+    last_hash = symbol.rfind('#')
+    start = max(symbol.rfind('/'), symbol.rfind('#', 0, last_hash), symbol.rfind(' '))
+    return symbol[start + 1:]
+
+def _add_definitions(definitions: Dict[str, List[Tuple[str, Any]]], relative_path: str, occurrences) -> None:
+    """Adds a document's definition occurrences to a "Type#member" lookup table."""
+    # Locals for everything the inner loop touches; it runs once per occurrence.
+    DEF = scip_pb2.SymbolRole.Definition
+    definition_key = _definition_key
+    setdefault = definitions.setdefault
+    for occ in occurrences:
+        if occ.symbol_roles & DEF:
+            setdefault(definition_key(occ.symbol), []).append((relative_path, occ))
+
+def _in_package(relative_path: str, package_path: str) -> bool:
+    """True if relative_path's directory is, or ends with, package_path (e.g. 'com/example')."""
+    directory = relative_path.rpartition('/')[0]
+    return directory == package_path or directory.endswith('/' + package_path)
+
+def _build_definitions(entry: Dict[str, Any], package_path: str = "") -> Dict[str, List[Tuple[str, Any]]]:
+    """
+    Decodes an entry's Documents (only those under package_path, if given)
+    straight from the cached bytes and maps each definition's "Type#member"
+    key to its (document relative_path, occurrence) pairs.
+    """
+    data = entry["data"]
+    definitions: Dict[str, List[Tuple[str, Any]]] = {}
+    for relative_path, offset, length in entry["documents"]:
+        if package_path and not _in_package(relative_path, package_path):
+            continue
+        doc = scip_pb2.Document()
+        doc.ParseFromString(data[offset:offset + length])
+        _add_definitions(definitions, relative_path, doc.occurrences)
+    return definitions
+
+def load_definitions(scip_index_path: Path, package_path: str = "") -> Optional[Dict[str, List[Tuple[str, Any]]]]:
+    """
+    Loads the definition lookup table for an index.scip file. With a
+    package_path (e.g. 'com/example'), only the Documents in that package's
+    directory are decoded, or the full table is narrowed if already loaded.
+    """
     try:
-        with open(scip_index_path, "rb") as f:
-            scip_index = scip_pb2.Index()
-            scip_index.ParseFromString(f.read())
-            return scip_index
+        entry = _get_index_entry(scip_index_path)
+        if not package_path:
+            if entry["definitions"] is None:
+                entry["definitions"] = _build_definitions(entry)
+            return entry["definitions"]
+        packages = entry["packages"]
+        definitions = packages.get(package_path)
+        if definitions is None:
+            if entry["definitions"] is not None:
+                # The full table is already decoded; narrowing it is cheaper
+                # than decoding the package's Documents a second time.
+                definitions = {}
+                for key, locations in entry["definitions"].items():
+                    in_package = [loc for loc in locations if _in_package(loc[0], package_path)]
+                    if in_package:
+                        definitions[key] = in_package
+            else:
+                definitions = _build_definitions(entry, package_path)
+            packages[package_path] = definitions
+            while len(packages) > _MAX_CACHED_PACKAGES:
+                packages.popitem(last=False)
+        return definitions
+    except FileNotFoundError:
+        print(f"Error: SCIP index file not found at {scip_index_path}")
+        return None
     except Exception as e:
         print(f"Error parsing SCIP index file {scip_index_path}: {e}")
         return None
 
+@functools.lru_cache(maxsize=1024)
+def _scip_suffix_from_fqn(fqn: str) -> str:
+    """
+    Converts a user-friendly FQN into the SCIP descriptor string that ends the
+    full SCIP symbol (the part after the 'semanticdb maven ...' prefix).
+    Example: "com.example.Main.greet" -> "com/example/Main#greet()."
+    """
+    # --- FIX: Refined heuristic to convert user query to SCIP-like descriptor string ---
+    parts = fqn.split('.')
+    # Assume a method: add parens and period
+    return f"{'/'.join(parts[:-2])}/{parts[-2]}#{parts[-1]}()."
+
+def _collect_definitions(definitions: Dict[str, List[Tuple[str, Any]]], definition_key: str,
+                         scip_like_query_suffix: str, root_str: str) -> List[Dict[str, Any]]:
+    """Returns the result dicts for the definitions whose symbol ends with the query suffix."""
+    results = []
+    # Any symbol ending with the suffix has "Class#method()." as its key, so a
+    # single lookup narrows the candidates before the endswith check.
+    for relative_path, occ in definitions.get(definition_key, ()):
+        # --- FIX: Use endswith for more robust matching ---
+        # Check if the occ.symbol ends with our constructed SCIP-like query suffix
+        if occ.symbol.endswith(scip_like_query_suffix):
+            # Extract range, handling both 3 and 4 element ranges
+            if len(occ.range) == 4:
+                start_line = occ.range[0]
+                start_char = occ.range[1]
+                end_line = occ.range[2]
+                end_char = occ.range[3]
+            elif len(occ.range) == 3:
+                start_line = occ.range[0]
+                start_char = occ.range[1]
+                end_line = occ.range[0] # End line is same as start line for 3-element range
+                end_char = occ.range[2]
+            else:
+                continue # Skip if range format is unexpected
+                
+            results.append({
+                "type": "definition",
+                "symbol": occ.symbol,
+                "file_path": root_str + relative_path,
+                "start_line": start_line + 1,
+                "start_character": start_char + 1,
+                "end_line": end_line + 1,
+                "end_character": end_char + 1
+            })
+    return results
+
 def structural_search(scip_index_path: Path, project_root: Path, query_symbol: str) -> List[Dict[str, Any]]:
     """
     Performs a structural search for a symbol's definition using a robust parser.
     Query symbol should be in the format: "com.example.Main.greet" (user-friendly FQN)
     """
-    scip_index = load_scip_index(scip_index_path)
-    if not scip_index:
-        return []
-
-    results = []
-    
-    # --- FIX: Refined heuristic to convert user query to SCIP-like descriptor string ---
-    # Example: "com.example.Main.greet" -> "com/example/Main#greet()."
-    query_parts = query_symbol.split('.')
-    
-    if len(query_parts) < 2: # At least Class.method or Package.Class
+    if query_symbol.count('.') < 1: # At least Class.method or Package.Class
         print(f"Warning: Query '{query_symbol}' is too short for SCIP conversion heuristic.")
         return []
 
-    method_name_with_paren = query_parts[-1] + '().' # Assume method, add parens and period
-    class_name = query_parts[-2]
-    package_path = '/'.join(query_parts[:-2])
-    
-    # Construct the SCIP-like descriptor string that ends the full SCIP symbol
-    # This is the part that follows the 'semanticdb maven ...' prefix
-    scip_like_query_suffix = f"{package_path}/{class_name}#{method_name_with_paren}"
-    
-    for doc in scip_index.documents:
-        for occ in doc.occurrences:
-            if occ.symbol_roles & scip_pb2.SymbolRole.Definition:
-                # --- FIX: Use endswith for more robust matching ---
-                # Check if the occ.symbol ends with our constructed SCIP-like query suffix
-                if occ.symbol.endswith(scip_like_query_suffix):
-                    # Extract range, handling both 3 and 4 element ranges
-                    if len(occ.range) == 4:
-                        start_line = occ.range[0]
-                        start_char = occ.range[1]
-                        end_line = occ.range[2]
-                        end_char = occ.range[3]
-                    elif len(occ.range) == 3:
-                        start_line = occ.range[0]
-                        start_char = occ.range[1]
-                        end_line = occ.range[0] # End line is same as start line for 3-element range
-                        end_char = occ.range[2]
-                    else:
-                        continue # Skip if range format is unexpected
-                        
-                    results.append({
-                        "type": "definition",
-                        "symbol": occ.symbol,
-                        "file_path": str(project_root / doc.relative_path),
-                        "start_line": start_line + 1,
-                        "start_character": start_char + 1,
-                        "end_line": end_line + 1,
-                        "end_character": end_char + 1
-                    })
+    # The suffix ends in the "Class#method()." definition key, and everything
+    # before its last '/' is the package directory.
+    scip_like_query_suffix = _scip_suffix_from_fqn(query_symbol)
+    package_path, _, definition_key = scip_like_query_suffix.rpartition('/')
+
+    # Result paths are built by concatenation rather than Path joins.
+    root_str = str(project_root).rstrip(os.sep) + os.sep
+
+    # Only decode the query package's Documents first. If nothing there
+    # matches (e.g. sources outside the package-directory layout, or the
+    # same Type#member in another package), search the whole index.
+    for scope in ((package_path, "") if package_path else ("",)):
+        definitions = load_definitions(scip_index_path, scope)
+        if definitions is None:
+            return []
+        results = _collect_definitions(definitions, definition_key, scip_like_query_suffix, root_str)
+        if results:
+            break
     return results
 
 if __name__ == "__main__":
@@ -144,4 +306,4 @@ if __name__ == "__main__":
             print(f"  Location: Line {res['start_line']}, Char {res['start_character']}")
     else:
         print("\nNo definition found for the symbol.")
-        print(f"Attempted to match with SCIP suffix: '{scip_like_query_suffix}' (variable from function scope is not available here)")
+        print(f"Attempted to match with SCIP suffix: '{_scip_suffix_from_fqn(query)}'")
@@ -0,0 +1,51 @@
+# src/fathom/online/scip_symbol.py
+
+import functools
+from typing import Any, Dict, Optional
+
+# --- SCIP Symbol Parsing ---
+# (parse_scip_symbol is not used by structural_search; it lives here so the
+# querier module doesn't carry it.)
+@functools.lru_cache(maxsize=100_000)
+def parse_scip_symbol(symbol: str) -> Optional[Dict[str, Any]]:
+    """
+    Parses a SCIP symbol string into its components.
+    Example: 'semanticdb maven maven/com.example/sample-java-project 1.0-SNAPSHOT com/example/Main#greet().'
+    This is a simplified parser for demonstration. A full parser would handle all descriptor types.
+    Results are memoized per symbol string, so treat the returned dict as read-only.
+    """
+    if symbol.startswith('local '):
+        return {'type': 'local', 'id': symbol.split(' ')[1]}
+
+    try:
+        parts = symbol.split(' ')
+        scheme = parts[0]
+        # Skip package info for now as it's static for our test project
+        # manager = parts[1]
+        # package_name = parts[2]
+        # version = parts[3]
+        
+        # The actual fully qualified name (FQN) part starts from index 4
+        fqn_part = parts[4] 
+        
+        # Simplified descriptor parsing for demonstration
+        # This part of the code needs to be truly robust for general SCIP parsing.
+        descriptors = []
+        # Example to extract descriptor names (very basic)
+        class_part, sep, member_part = fqn_part.partition('#')
+        if sep:
+            descriptors.append(class_part + '#') # Class
+            descriptors.append(member_part.partition('#')[0]) # Method/Field
+        else:
+            descriptors.append(fqn_part)
+
+        return {
+            'type': 'global',
+            'scheme': scheme,
+            # 'package': {'manager': manager, 'name': package_name, 'version': version},
+            'descriptors_str': fqn_part, # Storing the direct FQN part for now
+            'descriptors': descriptors # Simplified
+        }
+    except IndexError:
+        # Malformed symbol string
+        return None
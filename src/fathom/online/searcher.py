@@ -2,37 +2,226 @@
 
 from pathlib import Path
 import subprocess
+import tempfile
+import os
+import errno
+import stat
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import json
-import yaml
-from typing import List, Dict, Any, Optional
+import re
+from typing import List, Dict, Any, Optional, Iterator, Literal, NamedTuple, Set, Tuple
 
-# --- Configuration Loading ---
-def load_config(config_path: Path = Path("config.yaml")) -> Dict[str, Any]:
-    """Loads configuration from a YAML file."""
-    if not config_path.exists():
-        raise FileNotFoundError(f"Configuration file not found at {config_path}")
-    with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
+from ..config import get_config
 
-CONFIG = load_config()
+# orjson parses rg's small JSON records several times faster than the
+# stdlib; it's optional, so fall back to json when it isn't installed.
+try:
+    import orjson as _json
+except ImportError:
+    _json = json
 
-# --- Literal Search using Ripgrep ---
-def literal_search(project_root: Path, query: str) -> List[Dict[str, Any]]:
+# --- Cached File List ---
+# rg walks (and applies ignore rules to) the whole tree on every search. The
+# list of files it would search is cached per project and handed to rg as
+# explicit paths. rg has no --files-from, so the paths go on the command line,
+# split so each invocation stays under the OS argument-size limit.
+# rg skips files with a NUL byte early on when walking, but searches explicit
+# paths regardless, so such files are left out of the list.
+_BINARY_SNIFF_BYTES = 64 * 1024
+# Ignore files whose in-place edits change what rg searches without touching
+# any directory's mtime.
+_IGNORE_FILE_NAMES = (".gitignore", ".ignore", ".rgignore")
+# A path rg's walker skipped, as logged by `rg --debug`.
+_RG_IGNORING_LINE = re.compile(rb"ignoring (.+?): Ignore\(")
+
+def _arg_bytes_per_run() -> int:
+    """Returns how many bytes of path arguments one rg invocation may take."""
+    try:
+        arg_max = os.sysconf("SC_ARG_MAX")
+    except (AttributeError, ValueError, OSError):
+        # No sysconf (Windows), whose command line is capped at 32,767 characters.
+        return 30_000
+    # The environment shares the limit with argv; keep half of it as headroom.
+    env_bytes = sum(len(key) + len(value) + 2 for key, value in os.environ.items())
+    return max(arg_max // 2 - env_bytes, 4096)
+
+def _file_list_path(project_root: Path) -> Path:
+    """Returns where the cached file list for a project root is stored."""
+    root_hash = hashlib.blake2b(str(project_root.resolve()).encode(), digest_size=8).hexdigest()
+    return Path(get_config()["search_engine"]["file_list_path"]) / f"{project_root.name}-{root_hash}.json"
+
+def _is_binary(file_path: str) -> bool:
+    """Applies rg's NUL-byte heuristic to the start of a file."""
+    try:
+        with open(file_path, "rb") as f:
+            return b"\0" in f.read(_BINARY_SNIFF_BYTES)
+    except OSError:
+        return True
+
+def _rg_ignored_paths(debug_output: bytes) -> Set[str]:
     """
-    Performs a literal search using ripgrep within the specified project root.
+    Extracts the paths rg reports skipping ("ignoring <path>: Ignore(...)")
+    from its --debug output. If the format ever changes this just comes back
+    empty, which only makes the caller watch more directories than needed.
+    """
+    return {
+        os.fsdecode(match.group(1))
+        for match in _RG_IGNORING_LINE.finditer(debug_output)
+    }
 
-    Args:
-        project_root: The root directory of the project to search.
-        query: The string pattern to search for.
+def build_file_index(project_root: Path) -> Optional[List[str]]:
+    """
+    Records the files rg would search under project_root, plus the mtimes the
+    list depends on: every directory rg descends into (including empty ones
+    and ones holding only binary or ignored files), and the ignore files in
+    them. Trees rg skips, such as an ignored target/, are not watched, so
+    builds there don't invalidate the list.
 
-    Returns:
-        A list of dictionaries, where each dictionary represents a match
-        and contains file_path, line_number, and the matching text.
+    Returns the file list, or None if rg is unavailable.
+    Raises FileNotFoundError or NotADirectoryError if project_root isn't a directory.
+    """
+    root = str(project_root)
+    root_stat = os.stat(root)
+    if not stat.S_ISDIR(root_stat.st_mode):
+        raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), root)
+
+    try:
+        # Unreadable subdirectories are skipped (rg exits with 2 but still lists
+        # the rest). --debug makes rg log every path its walker skips.
+        result = subprocess.run(["rg", "--files", "--no-messages", "--debug", root], capture_output=True, check=False)
+    except FileNotFoundError:
+        return None
+    if result.returncode > 1 and not result.stdout:
+        return None
+    listed = os.fsdecode(result.stdout).splitlines()
+    ignored = _rg_ignored_paths(result.stderr)
+
+    # Walk the same directories rg did: hidden ones and the ones it reported
+    # ignoring are pruned, unreadable ones are skipped as rg skips them.
+    watched = {root: root_stat.st_mtime_ns}
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name in _IGNORE_FILE_NAMES:
+                    # Creating or deleting one changes the directory's mtime;
+                    # only in-place edits need the file itself watched.
+                    try:
+                        watched[entry.path] = entry.stat().st_mtime_ns
+                    except OSError:
+                        pass
+                elif (entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.')
+                        and entry.path not in ignored):
+                    try:
+                        watched[entry.path] = entry.stat(follow_symlinks=False).st_mtime_ns
+                    except OSError:
+                        continue
+                    stack.append(entry.path)
+
+    files = [path for path in listed if not _is_binary(path)]
+
+    # Written to a temporary file and renamed into place, so concurrent
+    # searches never read a half-written list.
+    index_path = _file_list_path(project_root)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=index_path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump({"watched": watched, "files": files}, f)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return files
+
+def _load_file_index(project_root: Path) -> Optional[List[str]]:
+    """Returns the cached file list for a project, or None if it is missing or stale."""
+    try:
+        with open(_file_list_path(project_root), "rb") as f:
+            index = _json.loads(f.read())
+        for path, mtime_ns in index["watched"].items():
+            if os.stat(path).st_mtime_ns != mtime_ns:
+                return None
+    except (OSError, ValueError, KeyError):
+        return None
+    return index["files"]
+
+def _search_targets(project_root: Path, language: Optional[str]) -> List[List[str]]:
+    """
+    Returns the path arguments for one or more rg runs: chunks of the cached
+    file list (building it if needed), or just the root if no list is available.
+    rg doesn't apply --type to explicit paths, so typed searches walk the root.
     """
-    if not project_root.is_dir():
+    if language:
+        return [[str(project_root)]]
+    files = _load_file_index(project_root)
+    if files is None:
+        files = build_file_index(project_root)
+    if files is None:
+        return [[str(project_root)]]
+
+    # Each argument costs its bytes, a NUL and an argv pointer.
+    max_bytes = _arg_bytes_per_run()
+    chunks, chunk, chunk_bytes = [], [], 0
+    for path in files:
+        path_bytes = len(os.fsencode(path)) + 9
+        if chunk and chunk_bytes + path_bytes > max_bytes:
+            chunks.append(chunk)
+            chunk, chunk_bytes = [], 0
+        chunk.append(path)
+        chunk_bytes += path_bytes
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def _iter_project_matches(command: List[str], project_root: Path, language: Optional[str]) -> Iterator[Dict[str, Any]]:
+    """Runs the rg command over every search target of a project, yielding match data."""
+    # A valid cached list implies the root exists (its mtime was just checked),
+    # and rebuilding the list fails on a bad root, so no separate is_dir() stat.
+    try:
+        search_targets = _search_targets(project_root, language)
+    except (FileNotFoundError, NotADirectoryError):
         print(f"Error: Project root not found or is not a directory: {project_root}")
-        return []
+        return
+    for targets in search_targets:
+        yield from _iter_rg_matches(command + targets)
+
+# --- Literal Search using Ripgrep ---
+class Match(NamedTuple):
+    """
+    One ripgrep match. A tuple instead of a dict per match (and per
+    submatch) keeps large result sets cheap; to_dict() gives the JSON shape.
+    """
+    file_path: str
+    line_number: int
+    line_text: str  # The raw line, trailing newline included
+    absolute_offset: int
+    submatches: Tuple[Tuple[int, int, str], ...]  # (start, end, matched text), byte offsets
+
+    @property
+    def match_text(self) -> str:
+        """The matched line without surrounding whitespace."""
+        return self.line_text.strip()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the match as a JSON-serializable dictionary."""
+        return {
+            "type": "match",
+            "file_path": self.file_path,
+            "line_number": self.line_number,
+            "match_text": self.match_text,
+            "absolute_offset": self.absolute_offset,
+            "submatches": [{"start": start, "end": end, "match": text} for start, end, text in self.submatches]
+        }
 
+def _rg_command(mode: Literal["literal", "regex"], language: Optional[str]) -> List[str]:
+    """Builds the common ripgrep arguments; callers append the patterns and the search path."""
     # Use --json output for easy parsing
     # -i for case-insensitive, -w for whole word (optional, depends on user intent)
     # --line-number for line numbers
@@ -40,60 +229,171 @@ def literal_search(project_root: Path, query: str) -> List[Dict[str, Any]]:
         "rg",
         "--json",
         "--line-number",
-        "--context", "1", # Show 1 line of context around match
-        query,
-        str(project_root)
+        "--no-messages", # Don't report unreadable files; real errors still set the exit code
     ]
+    if mode == "literal":
+        command += ["--fixed-strings", "--no-pcre2"]
+    if language:
+        command += ["--type", language]
+    return command
 
-    try:
-        result = subprocess.run(command, capture_output=True, text=True, check=False) # Changed check=True to check=False
-        
-        # ripgrep returns 0 for matches, 1 for no matches, and >1 for errors
-        if result.returncode == 0:
-            matches = []
-            for line in result.stdout.splitlines():
+def _iter_rg_matches(command: List[str]) -> Iterator[Dict[str, Any]]:
+    """Runs ripgrep and yields the "data" object of each JSON match record as it arrives."""
+    # stderr goes to a temporary file so a chatty rg can't block on a full
+    # pipe while we're still reading stdout.
+    with tempfile.TemporaryFile() as stderr_file:
+        try:
+            proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+        except FileNotFoundError:
+            print("Error: ripgrep (rg) command not found.")
+            print("Please ensure ripgrep is installed and available in your system's PATH.")
+            return
+
+        try:
+            # Lines are parsed as raw bytes; both parsers accept them directly.
+            for line in proc.stdout:
                 try:
-                    json_obj = json.loads(line)
-                    if json_obj["type"] == "match":
-                        data = json_obj["data"]
-                        match_data = {
-                            "type": "match",
-                            "file_path": data["path"]["text"],
-                            "line_number": data["line_number"],
-                            "match_text": data["lines"]["text"].strip() if "text" in data["lines"] else "",
-                            "absolute_offset": data["absolute_offset"],
-                            "submatches": []
-                        }
-                        for submatch in data["submatches"]:
-                            match_data["submatches"].append({
-                                "start": submatch["start"],
-                                "end": submatch["end"],
-                                "match": submatch["match"]["text"]
-                            })
-                        matches.append(match_data)
-                    elif json_obj["type"] == "context":
-                        # Optionally handle context lines if needed, for now we filter to just matches
-                        pass
-                except json.JSONDecodeError:
+                    json_obj = _json.loads(line)
+                except ValueError:
                     # ripgrep might output non-JSON lines for errors or warnings, ignore them
-                    pass
-            return matches
-        elif result.returncode == 1:
-            # No matches found, this is not an error for ripgrep
-            return []
-        else:
-            # A true error occurred
-            print(f"Error executing ripgrep: {result.returncode}")
-            print(f"Stderr: {result.stderr}")
-            return []
+                    continue
+                if json_obj["type"] == "match":
+                    yield json_obj["data"]
+            returncode = proc.wait()
+        except Exception as e:
+            print(f"An unexpected error occurred during literal search: {e}")
+            return
+        finally:
+            # Also reached when the consumer stops iterating early.
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
 
-    except FileNotFoundError:
-        print("Error: ripgrep (rg) command not found.")
-        print("Please ensure ripgrep is installed and available in your system's PATH.")
-        return []
-    except Exception as e:
-        print(f"An unexpected error occurred during literal search: {e}")
-        return []
+        # ripgrep returns 0 for matches, 1 for no matches, and >1 for errors
+        if returncode > 1:
+            stderr_file.seek(0)
+            print(f"Error executing ripgrep: {returncode}")
+            print(f"Stderr: {stderr_file.read().decode('utf-8', errors='replace')}")
+
+def iter_literal_search(
+    project_root: Path,
+    query: str,
+    mode: Literal["literal", "regex"] = "literal",
+    language: Optional[str] = None,
+) -> Iterator[Match]:
+    """
+    Performs a literal search using ripgrep within the specified project root,
+    yielding matches as ripgrep emits them instead of waiting for it to exit.
+
+    Args:
+        project_root: The root directory of the project to search.
+        query: The string pattern to search for.
+        mode: "literal" matches the query as a fixed string, which lets rg use
+            its SIMD literal matchers; "regex" treats it as a regular expression.
+        language: Optional rg file type (e.g. "java") to restrict the search to.
+
+    Yields:
+        A Match per match, with file_path, line_number, and the matching text.
+    """
+    command = _rg_command(mode, language) + ["--regexp", query]
+    for data in _iter_project_matches(command, project_root, language):
+        yield Match(
+            data["path"]["text"],
+            data["line_number"],
+            data["lines"].get("text", ""),
+            data["absolute_offset"],
+            tuple((submatch["start"], submatch["end"], submatch["match"]["text"]) for submatch in data["submatches"]),
+        )
+
+def literal_search(
+    project_root: Path,
+    query: str,
+    mode: Literal["literal", "regex"] = "literal",
+    language: Optional[str] = None,
+) -> List[Match]:
+    """
+    Performs a literal search using ripgrep within the specified project root.
+
+    Args:
+        project_root: The root directory of the project to search.
+        query: The string pattern to search for.
+        mode: "literal" (fixed string, the default) or "regex".
+        language: Optional rg file type (e.g. "java") to restrict the search to.
+
+    Returns:
+        A list of Match tuples containing file_path, line_number, and the
+        matching text. Use Match.to_dict() for a JSON-serializable form.
+    """
+    return list(iter_literal_search(project_root, query, mode, language))
+
+def literal_search_many(
+    project_root: Path,
+    queries: List[str],
+    mode: Literal["literal", "regex"] = "literal",
+    language: Optional[str] = None,
+) -> Dict[str, List[Match]]:
+    """
+    Runs literal_search for several queries concurrently, one rg process per
+    query. Threads are enough here: the work is waiting on subprocess I/O,
+    which releases the GIL.
+
+    Returns:
+        A dictionary mapping each query to its list of matches.
+    """
+    unique_queries = list(dict.fromkeys(queries))
+    if not unique_queries:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(unique_queries), os.cpu_count() or 1)) as executor:
+        results = executor.map(lambda query: literal_search(project_root, query, mode, language), unique_queries)
+        return dict(zip(unique_queries, results))
+
+def literal_search_batch(
+    project_root: Path,
+    queries: List[str],
+    language: Optional[str] = None,
+) -> Dict[str, List[Match]]:
+    """
+    Searches for several fixed strings in a single ripgrep pass, so the
+    project tree is walked once instead of once per query.
+
+    rg only reports the leftmost of overlapping patterns on a line, so each
+    matched line is re-checked against every query here. Each query's
+    results match what literal_search would return for it alone.
+
+    Returns:
+        A dictionary mapping each query to its list of matches.
+    """
+    unique_queries = [query for query in dict.fromkeys(queries) if query]
+    results: Dict[str, List[Match]] = {query: [] for query in unique_queries}
+    if not unique_queries:
+        return results
+
+    encoded_queries = [(query, query.encode('utf-8')) for query in unique_queries]
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".txt") as patterns_file:
+        patterns_file.write("\n".join(unique_queries))
+        patterns_file.flush()
+        command = _rg_command("literal", language) + ["--file", patterns_file.name]
+        for data in _iter_project_matches(command, project_root, language):
+            line_text = data["lines"].get("text", "")
+            line_bytes = line_text.encode('utf-8')
+            for query, query_bytes in encoded_queries:
+                # Non-overlapping occurrences, using byte offsets like rg.
+                submatches = []
+                start = line_bytes.find(query_bytes)
+                while start != -1:
+                    end = start + len(query_bytes)
+                    submatches.append((start, end, query))
+                    start = line_bytes.find(query_bytes, end)
+                if submatches:
+                    results[query].append(Match(
+                        data["path"]["text"],
+                        data["line_number"],
+                        line_text,
+                        data["absolute_offset"],
+                        tuple(submatches),
+                    ))
+    return results
 
 if __name__ == "__main__":
     # Example usage
@@ -107,7 +407,7 @@ if __name__ == "__main__":
     results_1 = literal_search(sample_project_path, search_query_1)
     if results_1:
         for result in results_1:
-            print(f"  File: {result['file_path']}, Line: {result['line_number']}, Match: {result['match_text']}")
+            print(f"  File: {result.file_path}, Line: {result.line_number}, Match: {result.match_text}")
     else:
         print("  No matches found.")
 
@@ -117,7 +417,7 @@ if __name__ == "__main__":
     results_2 = literal_search(sample_project_path, search_query_2)
     if results_2:
         for result in results_2:
-            print(f"  File: {result['file_path']}, Line: {result['line_number']}, Match: {result['match_text']}")
+            print(f"  File: {result.file_path}, Line: {result.line_number}, Match: {result.match_text}")
     else:
         print("  No matches found.")
 
@@ -127,6 +427,6 @@ if __name__ == "__main__":
     results_3 = literal_search(sample_project_path, search_query_3)
     if results_3:
         for result in results_3:
-            print(f"  File: {result['file_path']}, Line: {result['line_number']}, Match: {result['match_text']}")
+            print(f"  File: {result.file_path}, Line: {result.line_number}, Match: {result.match_text}")
     else:
         print("  No matches found.")